@@ -1,11 +1,13 @@
 """
 LangGraph ReAct agent for product photography chat.
-Runs inside the backend; tools call /upload, /generate, /status via HTTP.
+Runs inside the backend; generation calls KIE in-process through kie_client,
+upload_product_image still goes through /upload via HTTP.
 """
 import base64
 import contextvars
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
+from typing import Callable
 
 log = logging.getLogger(__name__)
 
@@ -16,9 +18,11 @@ _num_images_ctx: contextvars.ContextVar[int] = contextvars.ContextVar("num_image
 # Request-scoped user for credits (user_id, email)
 _user_id_ctx: contextvars.ContextVar[str | None] = contextvars.ContextVar("user_id", default=None)
 _user_email_ctx: contextvars.ContextVar[str | None] = contextvars.ContextVar("user_email", default=None)
+# Request-scoped sink for streamed events ("token", "thumbnail"); None when the caller is not streaming
+_event_sink_ctx: contextvars.ContextVar[Callable[[str, dict], None] | None] = contextvars.ContextVar("event_sink", default=None)
 import json
 import os
-import time
+import threading
 import uuid
 import warnings
 from pathlib import Path
@@ -27,7 +31,10 @@ warnings.filterwarnings("ignore", category=UserWarning, module="langchain_core")
 warnings.filterwarnings("ignore", message=".*create_react_agent.*")
 
 import requests
-from langchain_core.messages import HumanMessage, SystemMessage
+import kie_client
+from gen_scheduler import scheduler as generation_scheduler
+from task_poller import TaskPoller
+from langchain_core.messages import AIMessageChunk, HumanMessage, SystemMessage
 from langchain_core.tools import tool
 from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.memory import MemorySaver
@@ -140,7 +147,20 @@ def _upload_file_io(filepath: Path) -> str:
     return url
 
 
-def _generate_one_image(prompt: str, kie_url: str, base: str, model: str, aspect_ratio: str) -> list[str]:
+_poller: TaskPoller | None = None
+_poller_lock = threading.Lock()
+
+
+def _get_poller() -> TaskPoller:
+    """Process-wide poller shared by every in-flight generation."""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = TaskPoller(kie_client.get_status_sync, events=kie_client.task_events)
+    return _poller
+
+
+def _generate_one_image(prompt: str, kie_url: str, model: str, aspect_ratio: str) -> list[str]:
     """Generate a single image; returns list of URLs (usually 1)."""
     payload = {
         "model": model,
@@ -150,29 +170,31 @@ def _generate_one_image(prompt: str, kie_url: str, base: str, model: str, aspect
         "resolution": "1K",
         "output_format": "png",
     }
-    r = requests.post(f"{base}/generate", json=payload, timeout=60)
-    r.raise_for_status()
-    data = r.json()
+    data = kie_client.create_task_sync(*kie_client.build_task_input(payload))
     task_id = data.get("data", {}).get("taskId") or data.get("data", {}).get("recordId")
     if not task_id:
         raise RuntimeError("Generate response missing taskId")
 
-    for attempt in range(40):
-        s = requests.get(f"{base}/status", params={"task_id": task_id}, timeout=60)
-        s.raise_for_status()
-        sd = s.json().get("data", {})
-        state = sd.get("state")
-        if state == "success":
-            rj = sd.get("resultJson") or "{}"
-            try:
-                urls = json.loads(rj).get("resultUrls", [])
-                return urls if urls else []
-            except json.JSONDecodeError:
-                return []
-        if state == "fail":
-            raise RuntimeError(f"Generation failed: {sd}")
-        time.sleep(3)
-    raise TimeoutError("Generation timed out")
+    record = _get_poller().track(task_id).result()
+    sd = record.get("data", {})
+    if sd.get("state") == "fail":
+        raise RuntimeError(f"Generation failed: {sd}")
+    rj = sd.get("resultJson") or "{}"
+    try:
+        urls = json.loads(rj).get("resultUrls", [])
+        return urls if urls else []
+    except json.JSONDecodeError:
+        return []
+
+
+def _emit(event: str, data: dict) -> None:
+    sink = _event_sink_ctx.get()
+    if sink is None:
+        return
+    try:
+        sink(event, data)
+    except Exception as e:
+        log.warning("stream event %s dropped: %s", event, e)
 
 
 def _generate_product_image_impl(prompt: str, image_url: str, model: str = "nano-banana-pro") -> str:
@@ -181,25 +203,24 @@ def _generate_product_image_impl(prompt: str, image_url: str, model: str = "nano
     num_images = _num_images_ctx.get()
     log.info("generate_product_image start prompt=%r model=%s aspect_ratio=%s num_images=%d", prompt[:60], model, aspect_ratio, num_images)
     kie_url = _local_to_public_url(image_url)
-    base = _get_base_url()
 
     all_urls: list[str] = []
     num_images = max(1, min(num_images, 4))  # Clamp 1–4
 
-    if num_images == 1:
-        all_urls = _generate_one_image(prompt, kie_url, base, model, aspect_ratio)
-    else:
-        with ThreadPoolExecutor(max_workers=num_images) as executor:
-            futures = [
-                executor.submit(_generate_one_image, prompt, kie_url, base, model, aspect_ratio)
-                for _ in range(num_images)
-            ]
-            for future in as_completed(futures):
-                try:
-                    urls = future.result()
-                    all_urls.extend(urls)
-                except Exception as e:
-                    log.warning("One generation failed: %s", e)
+    # Shared scheduler: global KIE concurrency cap, round-robin across users
+    user_key = _user_id_ctx.get() or _user_email_ctx.get() or "anonymous"
+    futures = [
+        generation_scheduler.submit(user_key, _generate_one_image, prompt, kie_url, model, aspect_ratio)
+        for _ in range(num_images)
+    ]
+    for future in as_completed(futures):
+        try:
+            urls = future.result()
+            all_urls.extend(urls)
+            for url in urls:
+                _emit("thumbnail", {"url": url})
+        except Exception as e:
+            log.warning("One generation failed: %s", e)
 
     log.info("generate success total urls=%d", len(all_urls))
     return "\n".join(all_urls) if all_urls else "No result URLs."
@@ -285,10 +306,25 @@ def _get_agent():
     return _agent
 
 
-def chat_turn(message: str, thread_id: str = "default", image_url: str | None = None, model: str | None = None, aspect_ratio: str | None = None, num_images: int = 4, user_id: str | None = None, user_email: str | None = None) -> dict:
+def _stream_agent(agent, inputs: dict, config: dict, on_event: Callable[[str, dict], None]) -> dict:
+    """Run the agent, forwarding LLM tokens to on_event; returns the final state like invoke."""
+    result = None
+    for mode, chunk in agent.stream(inputs, config=config, stream_mode=["messages", "values"]):
+        if mode == "values":
+            result = chunk
+            continue
+        message, _metadata = chunk
+        if isinstance(message, AIMessageChunk) and isinstance(message.content, str) and message.content:
+            on_event("token", {"text": message.content})
+    return result
+
+
+def chat_turn(message: str, thread_id: str = "default", image_url: str | None = None, model: str | None = None, aspect_ratio: str | None = None, num_images: int = 4, user_id: str | None = None, user_email: str | None = None, on_event: Callable[[str, dict], None] | None = None) -> dict:
     """
     Run one agent turn. Returns { "content": str, "thumbnails": list[str] }.
+    If on_event is given, assistant tokens and each thumbnail URL are also pushed to it as they arrive.
     """
+    _event_sink_ctx.set(on_event)
     _aspect_ratio_ctx.set(aspect_ratio)
     _num_images_ctx.set(num_images if num_images and 1 <= num_images <= 4 else 4)
     _user_id_ctx.set(user_id)
@@ -311,7 +347,10 @@ def chat_turn(message: str, thread_id: str = "default", image_url: str | None =
         msgs.append(SystemMessage(content=SYSTEM_PROMPT))
     msgs.append(HumanMessage(content=enriched))
 
-    result = agent.invoke({"messages": msgs}, config=config)
+    if on_event is None:
+        result = agent.invoke({"messages": msgs}, config=config)
+    else:
+        result = _stream_agent(agent, {"messages": msgs}, config, on_event)
     last = result["messages"][-1]
     content = last.content if hasattr(last, "content") else str(last)
 
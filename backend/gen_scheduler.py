@@ -0,0 +1,117 @@
+"""
+Process-wide generation scheduler.
+A fixed pool of GENERATION_MAX_CONCURRENCY workers runs image generations, which caps
+concurrent KIE tasks for the whole process. Pending jobs queue per user and workers take
+them round-robin across users, so one heavy user cannot starve everyone else.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Callable
+
+GENERATION_MAX_CONCURRENCY = int(os.getenv("GENERATION_MAX_CONCURRENCY", "16"))
+WAIT_WINDOW = 500
+
+
+class _Job:
+    __slots__ = ("user_key", "fn", "args", "kwargs", "context", "future", "enqueued")
+
+    def __init__(self, user_key: str, fn: Callable, args: tuple, kwargs: dict) -> None:
+        self.user_key = user_key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.context = contextvars.copy_context()
+        self.future: Future = Future()
+        self.enqueued = time.monotonic()
+
+
+class GenerationScheduler:
+    def __init__(self, max_concurrency: int = GENERATION_MAX_CONCURRENCY) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self._cond = threading.Condition()
+        # user_key -> pending jobs; dict order is the round-robin rotation
+        self._queues: OrderedDict[str, deque[_Job]] = OrderedDict()
+        self._workers: list[threading.Thread] = []
+        self._running = 0
+        self._waits: deque[float] = deque(maxlen=WAIT_WINDOW)
+        self.submitted = 0
+        self.completed = 0
+
+    def submit(self, user_key: str, fn: Callable, *args, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) for user_key; runs in the caller's contextvars context."""
+        job = _Job(user_key or "anonymous", fn, args, kwargs)
+        with self._cond:
+            self._queues.setdefault(job.user_key, deque()).append(job)
+            self.submitted += 1
+            # Workers start lazily, one per queued job that no idle worker will pick up
+            if len(self._workers) < self.max_concurrency and self._pending() > self._idle_workers():
+                self._spawn_worker()
+            self._cond.notify()
+        return job.future
+
+    def _idle_workers(self) -> int:
+        return len(self._workers) - self._running
+
+    def _pending(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _spawn_worker(self) -> None:
+        worker = threading.Thread(target=self._work, name=f"generation-{len(self._workers)}", daemon=True)
+        self._workers.append(worker)
+        worker.start()
+
+    def _next_job(self) -> _Job:
+        # Caller holds the lock: take from the user at the head, then rotate them to the back
+        user_key, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        if queue:
+            self._queues.move_to_end(user_key)
+        else:
+            del self._queues[user_key]
+        return job
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                job = self._next_job()
+                self._running += 1
+            if job.future.set_running_or_notify_cancel():
+                wait = time.monotonic() - job.enqueued
+                with self._cond:
+                    self._waits.append(wait)
+                try:
+                    job.future.set_result(job.context.run(job.fn, *job.args, **job.kwargs))
+                except BaseException as exc:
+                    job.future.set_exception(exc)
+            with self._cond:
+                self._running -= 1
+                self.completed += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                "max_concurrency": self.max_concurrency,
+                "running": self._running,
+                "queue_depth": self._pending(),
+                "queued_users": len(self._queues),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "wait_avg_s": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "wait_p95_s": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 3) if waits else 0.0,
+            }
+
+    def queue_depth(self, user_key: str | None = None) -> int:
+        with self._cond:
+            if user_key is None:
+                return self._pending()
+            return len(self._queues.get(user_key, ()))
+
+
+scheduler = GenerationScheduler()
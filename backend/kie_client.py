@@ -0,0 +1,294 @@
+"""
+KIE API client shared by the HTTP routes (/generate, /status) and the agent tools.
+Routes use a pooled keep-alive httpx.AsyncClient per event loop; agent worker threads use
+one pooled httpx.Client. Both use HTTP/2 when h2 is installed and share the status cache,
+so the agent no longer loops back through our own API to reach KIE.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+
+import httpx
+
+from status_cache import TERMINAL_STATES, StatusCache, record_state
+from task_events import TaskEvents
+
+log = logging.getLogger(__name__)
+
+KIE_BASE_URL = os.getenv("KIE_BASE_URL", "https://api.kie.ai")
+KIE_API_KEY = os.getenv("KIE_API_KEY", "")
+KIE_MODEL = os.getenv("KIE_MODEL", "flux-2/pro-image-to-image")
+KIE_POOL_SIZE = int(os.getenv("KIE_POOL_SIZE", "20"))
+KIE_KEEPALIVE_EXPIRY = float(os.getenv("KIE_KEEPALIVE_EXPIRY", "30"))
+KIE_TIMEOUT = float(os.getenv("KIE_TIMEOUT", "60"))
+KIE_CONNECT_TIMEOUT = float(os.getenv("KIE_CONNECT_TIMEOUT", "10"))
+# Where KIE should POST task completion; falls back to API_BASE_URL/kie/callback for public hosts
+KIE_CALLBACK_URL = os.getenv("KIE_CALLBACK_URL", "")
+KIE_CALLBACK_TOKEN = os.getenv("KIE_CALLBACK_TOKEN", "")
+
+
+def callback_url() -> str | None:
+    url = KIE_CALLBACK_URL.strip()
+    if not url:
+        base = os.getenv("API_BASE_URL", "").strip().rstrip("/")
+        if not base or "localhost" in base or "127.0.0.1" in base:
+            return None  # KIE cannot reach us
+        url = f"{base}/kie/callback"
+    if KIE_CALLBACK_TOKEN:
+        url = f"{url}{'&' if '?' in url else '?'}token={KIE_CALLBACK_TOKEN}"
+    return url
+
+
+def _http2_available() -> bool:
+    if os.getenv("KIE_HTTP2", "1") != "1":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class KieError(Exception):
+    """Upstream KIE error; status_code/detail are passed through to the HTTP caller."""
+
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def build_task_input(payload: dict) -> tuple[str, dict]:
+    """Validate a /generate payload and return (model, KIE input) for createTask."""
+    input_url = payload.get("input_url")
+    prompt = payload.get("prompt")
+    aspect_ratio = payload.get("aspect_ratio", "4:3")
+    resolution = payload.get("resolution", "1K")
+    quality = payload.get("quality")
+    model = payload.get("model", KIE_MODEL)
+    image_size = payload.get("image_size")
+    rendering_speed = payload.get("rendering_speed")
+    style = payload.get("style")
+    num_images = payload.get("num_images")
+    seed = payload.get("seed")
+    image_input = payload.get("image_input")
+    output_format = payload.get("output_format")
+
+    if model == "ideogram/v3-reframe":
+        if not input_url or not image_size:
+            raise KieError(400, "input_url and image_size are required for ideogram/v3-reframe")
+        input_payload = {
+            "image_url": input_url,
+            "image_size": image_size,
+            **({"rendering_speed": rendering_speed} if rendering_speed else {}),
+            **({"style": style} if style else {}),
+            **({"num_images": num_images} if num_images else {}),
+            **({"seed": seed} if seed is not None else {}),
+        }
+    elif model == "nano-banana-pro":
+        if not prompt:
+            raise KieError(400, "prompt is required for nano-banana-pro")
+        input_payload = {
+            "prompt": prompt,
+            **({"image_input": image_input} if image_input else {}),
+            **({"aspect_ratio": aspect_ratio} if aspect_ratio else {}),
+            **({"resolution": resolution} if resolution else {}),
+            **({"output_format": output_format} if output_format else {}),
+        }
+    else:
+        if not input_url or not prompt:
+            raise KieError(400, "input_url and prompt are required")
+        input_payload = {
+            "input_urls": [input_url],
+            "prompt": prompt,
+            "aspect_ratio": aspect_ratio,
+            "resolution": resolution,
+            **({"quality": quality} if quality else {}),
+        }
+    return model, input_payload
+
+
+status_cache = StatusCache()
+task_events = TaskEvents()
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+_sync_client: httpx.Client | None = None
+_sync_client_lock = threading.Lock()
+
+
+def _client_options() -> dict:
+    return {
+        "base_url": KIE_BASE_URL,
+        "http2": _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=KIE_POOL_SIZE,
+            max_keepalive_connections=KIE_POOL_SIZE,
+            keepalive_expiry=KIE_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(KIE_TIMEOUT, connect=KIE_CONNECT_TIMEOUT),
+    }
+
+
+def _new_async_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(**_client_options())
+
+
+def _new_sync_client() -> httpx.Client:
+    return httpx.Client(**_client_options())
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the pooled client for the running loop (a client cannot be shared across loops)."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop or _client.is_closed:
+        _client = _new_async_client()
+        _client_loop = loop
+    return _client
+
+
+def get_sync_client() -> httpx.Client:
+    """Pooled client for worker threads (httpx.Client is thread-safe)."""
+    global _sync_client
+    with _sync_client_lock:
+        if _sync_client is None or _sync_client.is_closed:
+            _sync_client = _new_sync_client()
+        return _sync_client
+
+
+async def aclose() -> None:
+    global _client, _client_loop, _sync_client
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+    with _sync_client_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+        _sync_client = None
+
+
+def _headers(extra: dict | None = None) -> dict:
+    if not KIE_API_KEY:
+        raise KieError(500, "KIE_API_KEY is not configured")
+    return {"Authorization": f"Bearer {KIE_API_KEY}", **(extra or {})}
+
+
+def _parse(response: httpx.Response) -> dict:
+    if response.is_error:
+        raise KieError(response.status_code, response.text)
+    return response.json()
+
+
+def _create_task_request(model: str, input_payload: dict) -> dict:
+    body = {"model": model, "input": input_payload}
+    url = callback_url()
+    if url:
+        body["callBackUrl"] = url
+    return {
+        "method": "POST",
+        "url": "/api/v1/jobs/createTask",
+        "headers": _headers({"Content-Type": "application/json"}),
+        "json": body,
+    }
+
+
+def _record_info_request(task_id: str) -> dict:
+    return {
+        "method": "GET",
+        "url": "/api/v1/jobs/recordInfo",
+        "headers": _headers(),
+        "params": {"taskId": task_id},
+    }
+
+
+async def _send(request: dict) -> dict:
+    try:
+        response = await get_async_client().request(**request)
+    except httpx.HTTPError as exc:
+        log.warning("KIE %s %s failed: %s", request["method"], request["url"], exc)
+        raise KieError(502, f"KIE request failed: {exc}") from exc
+    return _parse(response)
+
+
+def _send_sync(request: dict) -> dict:
+    try:
+        response = get_sync_client().request(**request)
+    except httpx.HTTPError as exc:
+        log.warning("KIE %s %s failed: %s", request["method"], request["url"], exc)
+        raise KieError(502, f"KIE request failed: {exc}") from exc
+    return _parse(response)
+
+
+async def create_task(model: str, input_payload: dict) -> dict:
+    return await _send(_create_task_request(model, input_payload))
+
+
+def create_task_sync(model: str, input_payload: dict) -> dict:
+    return _send_sync(_create_task_request(model, input_payload))
+
+
+async def record_info(task_id: str) -> dict:
+    return await _send(_record_info_request(task_id))
+
+
+def record_info_sync(task_id: str) -> dict:
+    return _send_sync(_record_info_request(task_id))
+
+
+def publish_record(task_id: str, record: dict) -> None:
+    """Store a record (e.g. from a KIE callback) and wake waiters if it is terminal."""
+    status_cache.store(task_id, record)
+    if record_state(record) in TERMINAL_STATES:
+        task_events.publish(task_id, record)
+
+
+async def get_status(task_id: str) -> dict:
+    """recordInfo through the shared status cache (coalesced, TTL, terminal states kept)."""
+    record = await status_cache.get(task_id, lambda: record_info(task_id))
+    if record_state(record) in TERMINAL_STATES:
+        task_events.publish(task_id, record)
+    return record
+
+
+def get_status_sync(task_id: str) -> dict:
+    """Blocking get_status for worker threads; shares cache and in-flight requests with it."""
+    record = status_cache.get_sync(task_id, lambda: record_info_sync(task_id))
+    if record_state(record) in TERMINAL_STATES:
+        task_events.publish(task_id, record)
+    return record
+
+
+def _terminal_cached(task_id: str) -> dict | None:
+    cached = status_cache.peek(task_id)
+    return cached if cached and record_state(cached) in TERMINAL_STATES else None
+
+
+async def wait_for_completion(task_id: str, timeout: float) -> dict | None:
+    """Wait up to timeout for a terminal record to be published. None on timeout."""
+    future = task_events.subscribe(task_id)
+    try:
+        cached = _terminal_cached(task_id)
+        if cached:
+            return cached
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        task_events.unsubscribe(task_id, future)
+
+
+def wait_for_completion_sync(task_id: str, timeout: float) -> dict | None:
+    """Blocking variant of wait_for_completion for worker threads."""
+    future = task_events.subscribe(task_id)
+    try:
+        cached = _terminal_cached(task_id)
+        if cached:
+            return cached
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        return None
+    finally:
+        task_events.unsubscribe(task_id, future)
@@ -1,33 +1,60 @@
+import asyncio
+import functools
+import hashlib
+import json
 import logging
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional
 
+import anyio
 import requests
 
+import kie_client
+from gen_scheduler import scheduler as generation_scheduler
+from kie_client import KIE_API_KEY, KIE_CALLBACK_TOKEN, KieError
+from status_cache import TERMINAL_STATES, record_state
+from upload_index import UploadIndex
+
 # Logs go to stderr → CloudWatch
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 log = logging.getLogger(__name__)
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
 
 APP_TITLE = "Product Photo API"
-KIE_BASE_URL = os.getenv("KIE_BASE_URL", "https://api.kie.ai")
-KIE_API_KEY = os.getenv("KIE_API_KEY", "")
-KIE_MODEL = os.getenv("KIE_MODEL", "flux-2/pro-image-to-image")
 USE_S3 = os.getenv("USE_S3", "0") == "1"
 UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "/data/uploads"))
 PUBLIC_FILE_BASE = os.getenv("PUBLIC_FILE_BASE", "")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Slack for multipart boundaries/headers when rejecting on Content-Length
+UPLOAD_FORM_OVERHEAD = 64 * 1024
 VECTEEZY_API_KEY = os.getenv("VECTEEZY_API_KEY", "")
 VECTEEZY_ACCOUNT_ID = os.getenv("VECTEEZY_ACCOUNT_ID", "")
 VECTEEZY_BASE_URL = "https://api.vecteezy.com"
+# /status/stream: max stream lifetime, and how often to re-check KIE when no callback arrives
+STATUS_STREAM_TIMEOUT = float(os.getenv("STATUS_STREAM_TIMEOUT", "300"))
+STATUS_STREAM_POLL_INTERVAL = float(os.getenv("STATUS_STREAM_POLL_INTERVAL", "3"))
+STATUS_STREAM_CALLBACK_POLL_INTERVAL = float(os.getenv("STATUS_STREAM_CALLBACK_POLL_INTERVAL", "30"))
+# Max concurrent agent turns per process; each turn blocks one worker thread (LLM + KIE polling)
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "8"))
+
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    yield
+    await kie_client.aclose()
 
-app = FastAPI(title=APP_TITLE)
+
+app = FastAPI(title=APP_TITLE, lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -36,6 +63,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # Reject before Starlette parses (and spools) the multipart body
+    if request.url.path == "/upload":
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse({"detail": f"File exceeds {MAX_UPLOAD_BYTES} bytes"}, status_code=413)
+    return await call_next(request)
+
+
 try:
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 except OSError:
@@ -43,6 +81,9 @@ except OSError:
     UPLOAD_DIR = Path("/tmp/uploads")
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 app.mount("/files", StaticFiles(directory=UPLOAD_DIR), name="files")
+# Kept next to (not inside) UPLOAD_DIR so /files never serves it
+UPLOAD_INDEX_PATH = Path(os.getenv("UPLOAD_INDEX_PATH", "") or UPLOAD_DIR.parent / f"{UPLOAD_DIR.name}-index.sqlite3")
+upload_index = UploadIndex(UPLOAD_INDEX_PATH)
 
 CORS_HEADERS = {
     "Access-Control-Allow-Origin": "*",
@@ -127,105 +168,156 @@ def health_details() -> dict:
             "upload_dir": str(UPLOAD_DIR),
             "upload_dir_writable": upload_dir_writable,
         },
+        "status_cache": kie_client.status_cache.stats(),
+        "kie_callbacks_enabled": bool(kie_client.callback_url()),
+        "task_waiters": kie_client.task_events.waiting(),
+        "generation_scheduler": generation_scheduler.stats(),
     }
 
 
+async def save_upload_stream(file: UploadFile, partial: Path) -> tuple[int, str]:
+    """Copy an upload to partial in fixed-size chunks. Returns (size, sha256 hex)."""
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(partial, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return size, digest.hexdigest()
+
+
+def _find_existing_upload(sha256: str) -> Optional[dict]:
+    existing = upload_index.lookup(sha256)
+    if not existing:
+        return None
+    if not USE_S3 and not (UPLOAD_DIR / existing["filename"]).exists():
+        upload_index.forget(sha256)  # Local file was removed; store it again
+        return None
+    return existing
+
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)) -> JSONResponse:
     if not file.filename:
         raise HTTPException(status_code=400, detail="Missing filename")
 
-    ext = Path(file.filename).suffix or ".png"
-    filename = f"{uuid.uuid4().hex}{ext}"
+    partial = UPLOAD_DIR / f".{uuid.uuid4().hex}.part"
+    size, sha256 = await save_upload_stream(file, partial)
+
+    existing = await run_in_threadpool(_find_existing_upload, sha256)
+    if existing:
+        partial.unlink(missing_ok=True)
+        return JSONResponse({
+            "url": existing["url"],
+            "filename": existing["filename"],
+            "size": size,
+            "sha256": sha256,
+            "deduplicated": True,
+        })
+
+    # Content-addressed name: same bytes -> same file and same S3 key
+    ext = (Path(file.filename).suffix or ".png").lower()
+    filename = f"{sha256}{ext}"
     target = UPLOAD_DIR / filename
-    content = await file.read()
-    target.write_bytes(content)
+    await anyio.Path(partial).rename(target)
 
-    public_url = upload_to_s3(target, file.content_type) if USE_S3 else get_public_url(filename)
-    return JSONResponse({"url": public_url, "filename": filename})
+    if USE_S3:
+        public_url = await run_in_threadpool(upload_to_s3, target, file.content_type)
+    else:
+        public_url = get_public_url(filename)
+    await run_in_threadpool(upload_index.record, sha256, public_url, filename, file.content_type, size)
+    return JSONResponse({"url": public_url, "filename": filename, "size": size, "sha256": sha256, "deduplicated": False})
 
 
 @app.post("/generate")
-def create_task(payload: dict) -> JSONResponse:
+async def create_task(payload: dict) -> JSONResponse:
     require_api_key()
-    input_url = payload.get("input_url")
-    prompt = payload.get("prompt")
-    aspect_ratio = payload.get("aspect_ratio", "4:3")
-    resolution = payload.get("resolution", "1K")
-    quality = payload.get("quality")
-    model = payload.get("model", KIE_MODEL)
-    image_size = payload.get("image_size")
-    rendering_speed = payload.get("rendering_speed")
-    style = payload.get("style")
-    num_images = payload.get("num_images")
-    seed = payload.get("seed")
-    image_input = payload.get("image_input")
-    output_format = payload.get("output_format")
-
-    if model == "ideogram/v3-reframe":
-        if not input_url or not image_size:
-            raise HTTPException(
-                status_code=400,
-                detail="input_url and image_size are required for ideogram/v3-reframe",
-            )
-        input_payload = {
-            "image_url": input_url,
-            "image_size": image_size,
-            **({"rendering_speed": rendering_speed} if rendering_speed else {}),
-            **({"style": style} if style else {}),
-            **({"num_images": num_images} if num_images else {}),
-            **({"seed": seed} if seed is not None else {}),
-        }
-    elif model == "nano-banana-pro":
-        if not prompt:
-            raise HTTPException(status_code=400, detail="prompt is required for nano-banana-pro")
-        input_payload = {
-            "prompt": prompt,
-            **({"image_input": image_input} if image_input else {}),
-            **({"aspect_ratio": aspect_ratio} if aspect_ratio else {}),
-            **({"resolution": resolution} if resolution else {}),
-            **({"output_format": output_format} if output_format else {}),
-        }
-    else:
-        if not input_url or not prompt:
-            raise HTTPException(status_code=400, detail="input_url and prompt are required")
-        input_payload = {
-            "input_urls": [input_url],
-            "prompt": prompt,
-            "aspect_ratio": aspect_ratio,
-            "resolution": resolution,
-            **({"quality": quality} if quality else {}),
-        }
-
-    response = requests.post(
-        f"{KIE_BASE_URL}/api/v1/jobs/createTask",
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {KIE_API_KEY}",
-        },
-        json={
-            "model": model,
-            "input": input_payload,
-        },
-        timeout=60,
-    )
-    if not response.ok:
-        raise HTTPException(status_code=response.status_code, detail=response.text)
-    return JSONResponse(response.json())
+    try:
+        model, input_payload = kie_client.build_task_input(payload)
+        data = await kie_client.create_task(model, input_payload)
+    except KieError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
+    return JSONResponse(data)
 
 
 @app.get("/status")
-def task_status(task_id: str) -> JSONResponse:
+async def task_status(task_id: str) -> JSONResponse:
     require_api_key()
-    response = requests.get(
-        f"{KIE_BASE_URL}/api/v1/jobs/recordInfo",
-        headers={"Authorization": f"Bearer {KIE_API_KEY}"},
-        params={"taskId": task_id},
-        timeout=60,
+    try:
+        data = await kie_client.get_status(task_id)
+    except KieError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail) from exc
+    return JSONResponse(data)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/status/stream")
+async def task_status_stream(task_id: str) -> StreamingResponse:
+    """Server-sent events for one task: a status event per state change, ends on success/fail."""
+    require_api_key()
+    # With callbacks registered the re-check is only a safety net (e.g. callback hit another instance)
+    poll_interval = STATUS_STREAM_CALLBACK_POLL_INTERVAL if kie_client.callback_url() else STATUS_STREAM_POLL_INTERVAL
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STATUS_STREAM_TIMEOUT
+        try:
+            record = await kie_client.get_status(task_id)
+        except KieError as exc:
+            yield _sse("error", {"status_code": exc.status_code, "detail": exc.detail})
+            return
+        yield _sse("status", record)
+        state = record_state(record)
+        while state not in TERMINAL_STATES:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                yield _sse("timeout", {"task_id": task_id, "state": state})
+                return
+            record = await kie_client.wait_for_completion(task_id, timeout=min(poll_interval, remaining))
+            if record is None:
+                try:
+                    record = await kie_client.get_status(task_id)
+                except KieError as exc:
+                    yield _sse("error", {"status_code": exc.status_code, "detail": exc.detail})
+                    return
+            if record_state(record) == state:
+                yield ": keepalive\n\n"
+                continue
+            state = record_state(record)
+            yield _sse("status", record)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    if not response.ok:
-        raise HTTPException(status_code=response.status_code, detail=response.text)
-    return JSONResponse(response.json())
+
+
+@app.post("/kie/callback")
+async def kie_callback(request: Request, token: Optional[str] = None) -> JSONResponse:
+    """KIE task completion callback (registered as callBackUrl by /generate)."""
+    if KIE_CALLBACK_TOKEN and token != KIE_CALLBACK_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid callback token")
+    body = await request.json()
+    data = body.get("data") if isinstance(body, dict) else None
+    task_id = (data or {}).get("taskId")
+    if not task_id:
+        raise HTTPException(status_code=400, detail="Callback missing data.taskId")
+    log.info("kie callback task_id=%s state=%s", task_id, data.get("state"))
+    kie_client.publish_record(task_id, body)
+    return JSONResponse({"status": "ok"})
 
 
 @app.get("/proxy")
@@ -257,34 +349,57 @@ def proxy_options() -> Response:
     )
 
 
+# Agent turns are synchronous (LangGraph invoke, requests, time.sleep); run them here so
+# the event loop keeps serving /health, /status etc. while chats are in flight.
+_chat_executor = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="chat")
+
+
+async def _run_chat_turn(**kwargs) -> dict:
+    from agent import chat_turn
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_chat_executor, functools.partial(chat_turn, **kwargs))
+
+
 def _require_openai() -> None:
     if not os.getenv("OPENAI_API_KEY"):
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY is not configured")
 
 
-@app.post("/chat")
-async def chat(payload: dict) -> JSONResponse:
-    """Chat with the product photography agent. Payload: { message, thread_id?, image_url?, model? }."""
-    _require_openai()
+def _chat_kwargs(payload: dict) -> dict:
+    """Validate a /chat payload into chat_turn keyword arguments."""
     message = payload.get("message")
     if not message or not isinstance(message, str):
         raise HTTPException(status_code=400, detail="message is required and must be a string")
-    thread_id = payload.get("thread_id") or "default"
-    image_url = payload.get("image_url")
-    model = payload.get("model")
-    aspect_ratio = payload.get("aspect_ratio")
     num_images = payload.get("num_images", 4)
-    user_id = payload.get("user_id")
-    user_email = payload.get("user_email")
     if isinstance(num_images, (int, float)):
         num_images = int(num_images)
     else:
         num_images = 4
-    log.info("chat request thread_id=%s has_image=%s model=%s aspect_ratio=%s num_images=%d msg_len=%d", thread_id, bool(image_url), model, aspect_ratio, num_images, len(message))
+    return {
+        "message": message,
+        "thread_id": payload.get("thread_id") or "default",
+        "image_url": payload.get("image_url"),
+        "model": payload.get("model"),
+        "aspect_ratio": payload.get("aspect_ratio"),
+        "num_images": num_images,
+        "user_id": payload.get("user_id"),
+        "user_email": payload.get("user_email"),
+    }
+
+
+def _log_chat_request(kwargs: dict) -> None:
+    log.info("chat request thread_id=%s has_image=%s model=%s aspect_ratio=%s num_images=%d msg_len=%d", kwargs["thread_id"], bool(kwargs["image_url"]), kwargs["model"], kwargs["aspect_ratio"], kwargs["num_images"], len(kwargs["message"]))
+
+
+@app.post("/chat")
+async def chat(payload: dict) -> JSONResponse:
+    """Chat with the product photography agent. Payload: { message, thread_id?, image_url?, model? }."""
+    _require_openai()
+    kwargs = _chat_kwargs(payload)
+    _log_chat_request(kwargs)
 
     try:
-        from agent import chat_turn
-        out = chat_turn(message=message, thread_id=thread_id, image_url=image_url, model=model, aspect_ratio=aspect_ratio, num_images=num_images, user_id=user_id, user_email=user_email)
+        out = await _run_chat_turn(**kwargs)
         thumb_count = len(out.get("thumbnails", []))
         log.info("chat response thumbnails=%d", thumb_count)
         return JSONResponse({"content": out["content"], "thumbnails": out.get("thumbnails", [])})
@@ -294,14 +409,51 @@ async def chat(payload: dict) -> JSONResponse:
         # Retry with fresh thread if corrupted checkpoint (tool_calls without response)
         if "tool_call" in err_str.lower() and "tool_call_id" in err_str:
             try:
-                fresh_id = f"{thread_id}-{uuid.uuid4().hex[:8]}"
-                out = chat_turn(message=message, thread_id=fresh_id, image_url=image_url, model=model, aspect_ratio=aspect_ratio, num_images=num_images, user_id=user_id, user_email=user_email)
+                fresh_id = f"{kwargs['thread_id']}-{uuid.uuid4().hex[:8]}"
+                out = await _run_chat_turn(**{**kwargs, "thread_id": fresh_id})
                 return JSONResponse({"content": out["content"], "thumbnails": out.get("thumbnails", [])})
             except Exception:
                 pass
         raise HTTPException(status_code=500, detail=err_str) from exc
 
 
+@app.post("/chat/stream")
+async def chat_stream(payload: dict) -> StreamingResponse:
+    """
+    Same payload as /chat, answered as server-sent events: "token" for assistant text,
+    "thumbnail" for each generated image as soon as it finishes, then "done" (or "error").
+    """
+    _require_openai()
+    kwargs = _chat_kwargs(payload)
+    _log_chat_request(kwargs)
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def on_event(event: str, data: dict) -> None:
+        # Called from the chat worker thread
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    async def events():
+        turn = asyncio.ensure_future(_run_chat_turn(on_event=on_event, **kwargs))
+        turn.add_done_callback(lambda _: queue.put_nowait(None))
+        while (item := await queue.get()) is not None:
+            yield _sse(*item)
+        try:
+            out = turn.result()
+        except Exception as exc:
+            log.exception("chat stream failed: %s", exc)
+            yield _sse("error", {"detail": str(exc)})
+            return
+        log.info("chat stream response thumbnails=%d", len(out.get("thumbnails", [])))
+        yield _sse("done", {"content": out["content"], "thumbnails": out.get("thumbnails", [])})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/vecteezy/resources")
 def vecteezy_resources(
     term: str,
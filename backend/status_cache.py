@@ -0,0 +1,136 @@
+"""
+Status layer in front of KIE recordInfo.
+- Concurrent polls for one task_id share a single in-flight upstream request.
+- Non-terminal results are reused for STATUS_CACHE_TTL seconds.
+- Terminal (success/fail) results are kept in a bounded LRU and never fetched again.
+Safe to use from several threads and event loops: in-flight requests are
+concurrent.futures.Future objects, which async callers await via asyncio.wrap_future.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable
+
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", "2"))
+TERMINAL_CACHE_SIZE = int(os.getenv("TERMINAL_CACHE_SIZE", "10000"))
+TERMINAL_STATES = {"success", "fail"}
+
+
+def record_state(record: dict) -> str | None:
+    """State from a recordInfo response body ({"data": {"state": ...}})."""
+    return (record.get("data") or {}).get("state")
+
+
+class StatusCache:
+    def __init__(self, ttl: float = STATUS_CACHE_TTL, terminal_size: int = TERMINAL_CACHE_SIZE) -> None:
+        self.ttl = ttl
+        self.terminal_size = terminal_size
+        self._lock = threading.Lock()
+        self._fresh: dict[str, tuple[float, dict]] = {}
+        self._terminal: OrderedDict[str, dict] = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self.upstream_calls = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+
+    def _cached(self, task_id: str) -> dict | None:
+        # Caller holds the lock
+        if task_id in self._terminal:
+            self._terminal.move_to_end(task_id)
+            return self._terminal[task_id]
+        entry = self._fresh.get(task_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        self._fresh.pop(task_id, None)
+        return None
+
+    def peek(self, task_id: str) -> dict | None:
+        with self._lock:
+            return self._cached(task_id)
+
+    def store(self, task_id: str, record: dict) -> None:
+        with self._lock:
+            if record_state(record) in TERMINAL_STATES:
+                self._fresh.pop(task_id, None)
+                self._terminal[task_id] = record
+                self._terminal.move_to_end(task_id)
+                while len(self._terminal) > self.terminal_size:
+                    self._terminal.popitem(last=False)
+            elif task_id not in self._terminal:
+                self._fresh[task_id] = (time.monotonic() + self.ttl, record)
+                if len(self._fresh) > self.terminal_size:
+                    now = time.monotonic()
+                    self._fresh = {k: v for k, v in self._fresh.items() if v[0] > now}
+
+    def _claim(self, task_id: str) -> tuple[dict | None, Future, bool]:
+        """Return (cached record, in-flight future, is_leader)."""
+        with self._lock:
+            cached = self._cached(task_id)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached, None, False
+            future = self._inflight.get(task_id)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            future = Future()
+            self._inflight[task_id] = future
+            self.upstream_calls += 1
+            return None, future, True
+
+    def _release(self, task_id: str) -> None:
+        with self._lock:
+            self._inflight.pop(task_id, None)
+
+    async def get(self, task_id: str, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        cached, future, leader = self._claim(task_id)
+        if cached is not None:
+            return cached
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            record = await fetch()
+        except Exception as exc:
+            self._release(task_id)
+            future.set_exception(exc)
+            raise
+        except BaseException:
+            self._release(task_id)
+            future.cancel()
+            raise
+        self.store(task_id, record)
+        self._release(task_id)
+        future.set_result(record)
+        return record
+
+    def get_sync(self, task_id: str, fetch: Callable[[], dict]) -> dict:
+        """Blocking variant of get for worker threads."""
+        cached, future, leader = self._claim(task_id)
+        if cached is not None:
+            return cached
+        if not leader:
+            return future.result()
+        try:
+            record = fetch()
+        except BaseException as exc:
+            self._release(task_id)
+            future.set_exception(exc)
+            raise
+        self.store(task_id, record)
+        self._release(task_id)
+        future.set_result(record)
+        return record
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "upstream_calls": self.upstream_calls,
+                "cache_hits": self.cache_hits,
+                "coalesced": self.coalesced,
+                "inflight": len(self._inflight),
+                "fresh_entries": len(self._fresh),
+                "terminal_entries": len(self._terminal),
+            }
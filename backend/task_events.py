@@ -0,0 +1,47 @@
+"""
+In-process task completion registry.
+KIE callbacks and terminal status lookups publish here; anyone waiting on the task
+(SSE streams, agent generation loops) is woken at once instead of sleeping out a poll interval.
+Waiters are concurrent.futures.Future objects so both threads and event loops can wait.
+"""
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+
+class TaskEvents:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._waiters: dict[str, list[Future]] = {}
+
+    def subscribe(self, task_id: str) -> Future:
+        future: Future = Future()
+        with self._lock:
+            self._waiters.setdefault(task_id, []).append(future)
+        return future
+
+    def unsubscribe(self, task_id: str, future: Future) -> None:
+        with self._lock:
+            waiters = self._waiters.get(task_id)
+            if not waiters:
+                return
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                del self._waiters[task_id]
+
+    def publish(self, task_id: str, record: dict) -> int:
+        """Resolve every waiter for task_id with record. Returns how many were woken."""
+        with self._lock:
+            waiters = self._waiters.pop(task_id, [])
+        woken = 0
+        for future in waiters:
+            try:
+                future.set_result(record)
+                woken += 1
+            except InvalidStateError:
+                pass  # Waiter timed out / was cancelled concurrently
+        return woken
+
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(w) for w in self._waiters.values())
@@ -0,0 +1,208 @@
+"""
+One background poller for every in-flight KIE task.
+Callers track(task_id) and get a Future resolved with the terminal recordInfo body.
+Each task's next check is scheduled from observed completion times: sparse before the
+fastest typical finish, dense around the expected finish, backing off past the slow tail.
+Records published to task_events (KIE callbacks) resolve tracked tasks immediately.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Callable
+
+from status_cache import TERMINAL_STATES, record_state
+from task_events import TaskEvents
+
+log = logging.getLogger(__name__)
+
+POLLER_MIN_INTERVAL = float(os.getenv("POLLER_MIN_INTERVAL", "1.5"))
+POLLER_MAX_INTERVAL = float(os.getenv("POLLER_MAX_INTERVAL", "15"))
+POLLER_TIMEOUT = float(os.getenv("POLLER_TIMEOUT", "180"))
+POLLER_FETCH_WORKERS = int(os.getenv("POLLER_FETCH_WORKERS", "4"))
+POLLER_MAX_ERRORS = 5
+# Completion times (seconds) assumed until real ones are observed
+DEFAULT_COMPLETION_TIMES = (20.0, 30.0, 45.0)
+COMPLETION_WINDOW = 200
+
+
+def _quantile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Tracked:
+    __slots__ = ("task_id", "future", "started", "deadline", "polls", "errors", "past_tail", "last_pending")
+
+    def __init__(self, task_id: str, future: Future, timeout: float) -> None:
+        self.task_id = task_id
+        self.future = future
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self.polls = 0
+        self.errors = 0
+        self.past_tail = 0
+        self.last_pending = 0.0  # Seconds since start at the last non-terminal poll
+
+
+class TaskPoller:
+    def __init__(self, fetch: Callable[[str], dict], events: TaskEvents | None = None) -> None:
+        self._fetch = fetch
+        self._events = events
+        self._cond = threading.Condition()
+        self._tasks: dict[str, _Tracked] = {}
+        self._schedule: list[tuple[float, str]] = []
+        self._durations: deque[float] = deque(DEFAULT_COMPLETION_TIMES, maxlen=COMPLETION_WINDOW)
+        self._observed = 0
+        self._thread: threading.Thread | None = None
+        self._fetchers = ThreadPoolExecutor(max_workers=POLLER_FETCH_WORKERS, thread_name_prefix="kie-poll")
+        self.polls = 0
+        self.completed = 0
+        self.timeouts = 0
+
+    # -- public -------------------------------------------------------------
+
+    def track(self, task_id: str, timeout: float = POLLER_TIMEOUT) -> Future:
+        """Start tracking task_id; the Future resolves with its terminal record."""
+        with self._cond:
+            tracked = self._tasks.get(task_id)
+            if tracked:
+                return tracked.future
+            tracked = _Tracked(task_id, Future(), timeout)
+            self._tasks[task_id] = tracked
+            heapq.heappush(self._schedule, (tracked.started + self._next_delay(tracked), task_id))
+            self._ensure_thread()
+            self._cond.notify()
+        if self._events is not None:
+            waiter = self._events.subscribe(task_id)
+            waiter.add_done_callback(lambda f: self._on_event(task_id, f))
+            tracked.future.add_done_callback(lambda _: self._events.unsubscribe(task_id, waiter))
+        return tracked.future
+
+    def quantiles(self) -> tuple[float, float, float]:
+        """(p10, p50, p90) of recent completion times."""
+        with self._cond:
+            ordered = sorted(self._durations)
+        return _quantile(ordered, 0.1), _quantile(ordered, 0.5), _quantile(ordered, 0.9)
+
+    def stats(self) -> dict:
+        p10, p50, p90 = self.quantiles()
+        with self._cond:
+            return {
+                "tracked": len(self._tasks),
+                "polls": self.polls,
+                "completed": self.completed,
+                "timeouts": self.timeouts,
+                "observed_completions": self._observed,
+                "completion_p10": round(p10, 2),
+                "completion_p50": round(p50, 2),
+                "completion_p90": round(p90, 2),
+            }
+
+    # -- scheduling ---------------------------------------------------------
+
+    def _next_delay(self, tracked: _Tracked) -> float:
+        # Caller holds the lock
+        ordered = sorted(self._durations)
+        p10, p90 = _quantile(ordered, 0.1), _quantile(ordered, 0.9)
+        elapsed = time.monotonic() - tracked.started
+        if elapsed < p10:
+            # Little finishes this early: one probe halfway (so faster completions can be
+            # learned), then sleep until the fast tail
+            delay = p10 / 2 if tracked.polls == 0 else p10 - elapsed
+        elif elapsed <= p90:
+            delay = POLLER_MIN_INTERVAL
+        else:
+            delay = POLLER_MIN_INTERVAL * (2 ** tracked.past_tail)
+            tracked.past_tail += 1
+        return max(POLLER_MIN_INTERVAL, min(delay, POLLER_MAX_INTERVAL))
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="kie-poller", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._schedule:
+                    self._cond.wait()
+                due_at, task_id = self._schedule[0]
+                now = time.monotonic()
+                if due_at > now:
+                    self._cond.wait(due_at - now)
+                    continue
+                heapq.heappop(self._schedule)
+                tracked = self._tasks.get(task_id)
+                if tracked is None:
+                    continue
+                if now >= tracked.deadline:
+                    self._finish(tracked, error=TimeoutError(f"Generation timed out (task {task_id})"))
+                    self.timeouts += 1
+                    continue
+            self._fetchers.submit(self._poll, tracked)
+
+    def _poll(self, tracked: _Tracked) -> None:
+        try:
+            record = self._fetch(tracked.task_id)
+        except Exception as exc:
+            with self._cond:
+                tracked.errors += 1
+                if tracked.errors >= POLLER_MAX_ERRORS:
+                    self._finish(tracked, error=exc)
+                    return
+                self._reschedule(tracked)
+            log.warning("poll task_id=%s failed: %s", tracked.task_id, exc)
+            return
+        with self._cond:
+            self.polls += 1
+            tracked.polls += 1
+            tracked.errors = 0
+            if record_state(record) in TERMINAL_STATES:
+                self._finish(tracked, record=record, polled=True)
+            else:
+                tracked.last_pending = time.monotonic() - tracked.started
+                self._reschedule(tracked)
+
+    def _reschedule(self, tracked: _Tracked) -> None:
+        # Caller holds the lock
+        if tracked.task_id not in self._tasks:
+            return
+        heapq.heappush(self._schedule, (time.monotonic() + self._next_delay(tracked), tracked.task_id))
+        self._cond.notify()
+
+    def _on_event(self, task_id: str, waiter: Future) -> None:
+        if waiter.cancelled():
+            return
+        with self._cond:
+            tracked = self._tasks.get(task_id)
+            if tracked is not None:
+                self._finish(tracked, record=waiter.result())
+
+    def _finish(
+        self,
+        tracked: _Tracked,
+        record: dict | None = None,
+        error: BaseException | None = None,
+        polled: bool = False,
+    ) -> None:
+        # Caller holds the lock; stale heap entries are skipped once the task is gone
+        if self._tasks.pop(tracked.task_id, None) is None:
+            return
+        if record is not None:
+            self.completed += 1
+            if self._observed == 0:
+                self._durations.clear()  # Drop the assumed prior once real data arrives
+            self._observed += 1
+            elapsed = time.monotonic() - tracked.started
+            # A poll only brackets the finish between the previous check and this one
+            self._durations.append((tracked.last_pending + elapsed) / 2 if polled else elapsed)
+        try:
+            if error is not None:
+                tracked.future.set_exception(error)
+            else:
+                tracked.future.set_result(record)
+        except InvalidStateError:
+            pass
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+# Unit tests import main/agent directly; keep them off /data and away from real keys.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="uploads-"))
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+@pytest.fixture
+def kie_stub(monkeypatch):
+    """Route the shared KIE client to an in-process stand-in of the KIE jobs API."""
+    import kie_client
+    import main
+    from kie_stub import KieStub
+
+    stub = KieStub()
+    monkeypatch.setattr(main, "KIE_API_KEY", "test")
+    monkeypatch.setattr(kie_client, "KIE_API_KEY", "test")
+    monkeypatch.setattr(
+        kie_client,
+        "_new_async_client",
+        lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=stub.app), base_url="http://kie"),
+    )
+    monkeypatch.setattr(kie_client, "_sync_client", None)
+    monkeypatch.setattr(kie_client, "_new_sync_client", lambda: TestClient(stub.app, base_url="http://kie"))
+    return stub
@@ -0,0 +1,51 @@
+"""Local stand-in for the KIE jobs API (createTask / recordInfo) used by unit tests."""
+import asyncio
+import json
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class KieStub:
+    def __init__(self) -> None:
+        self.app = FastAPI()
+        self.tasks: dict[str, dict] = {}
+        self.create_calls = 0
+        self.record_calls = 0
+        self.polls_until_success = 0
+        self.delay = 0.0
+        self.app.post("/api/v1/jobs/createTask")(self._create_task)
+        self.app.get("/api/v1/jobs/recordInfo")(self._record_info)
+
+    def finish(self, task_id: str, urls: list[str] | None = None, state: str = "success") -> dict:
+        task = self.tasks[task_id]
+        task["state"] = state
+        task["resultJson"] = json.dumps({"resultUrls": urls or [f"https://cdn.example/{task_id}.png"]})
+        return task
+
+    async def _create_task(self, request: Request) -> dict:
+        self.create_calls += 1
+        body = await request.json()
+        task_id = uuid.uuid4().hex
+        self.tasks[task_id] = {
+            "taskId": task_id,
+            "model": body["model"],
+            "state": "waiting",
+            "callBackUrl": body.get("callBackUrl"),
+            "polls": 0,
+        }
+        return {"code": 200, "msg": "success", "data": {"taskId": task_id}}
+
+    async def _record_info(self, taskId: str):
+        self.record_calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        task = self.tasks.get(taskId)
+        if task is None:
+            return JSONResponse({"code": 404, "msg": "task not found"}, status_code=404)
+        task["polls"] += 1
+        if task["state"] == "waiting" and task["polls"] > self.polls_until_success > 0:
+            self.finish(taskId)
+        data = {k: v for k, v in task.items() if k not in ("polls", "callBackUrl")}
+        return {"code": 200, "msg": "success", "data": data}
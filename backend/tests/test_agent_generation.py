@@ -0,0 +1,67 @@
+import pytest
+
+import agent
+import kie_client
+import task_poller
+from status_cache import StatusCache
+from task_events import TaskEvents
+from task_poller import TaskPoller
+
+
+@pytest.fixture
+def fast_agent(kie_stub, monkeypatch):
+    """Agent generation wired to the KIE stand-in with a fast poller and no HTTP loopback."""
+    monkeypatch.setattr(task_poller, "POLLER_MIN_INTERVAL", 0.01)
+    monkeypatch.setattr(task_poller, "DEFAULT_COMPLETION_TIMES", (0.02, 0.03, 0.05))
+    monkeypatch.setattr(kie_client, "status_cache", StatusCache(ttl=0))
+    monkeypatch.setattr(kie_client, "task_events", TaskEvents())
+    monkeypatch.setattr(agent, "_poller", TaskPoller(kie_client.get_status_sync, events=kie_client.task_events))
+    monkeypatch.setattr(agent, "_local_to_public_url", lambda url: url)
+
+    def no_loopback(*args, **kwargs):
+        raise AssertionError("agent must not call its own HTTP API")
+
+    monkeypatch.setattr(agent.requests, "get", no_loopback)
+    monkeypatch.setattr(agent.requests, "post", no_loopback)
+    return kie_stub
+
+
+def test_generation_calls_kie_in_process(fast_agent) -> None:
+    fast_agent.polls_until_success = 2
+    agent._num_images_ctx.set(3)
+
+    out = agent._generate_product_image_impl("marble counter", "https://cdn.example/in.png")
+
+    urls = out.splitlines()
+    assert len(urls) == 3
+    assert fast_agent.create_calls == 3
+    assert all(t["state"] == "success" for t in fast_agent.tasks.values())
+    assert {u.rsplit("/", 1)[1].removesuffix(".png") for u in urls} == set(fast_agent.tasks)
+
+
+def test_failed_tasks_are_dropped(fast_agent, monkeypatch) -> None:
+    agent._num_images_ctx.set(1)
+    real_create = kie_client.create_task_sync
+
+    def create_and_fail(model, input_payload):
+        data = real_create(model, input_payload)
+        fast_agent.finish(data["data"]["taskId"], state="fail")
+        return data
+
+    monkeypatch.setattr(kie_client, "create_task_sync", create_and_fail)
+
+    assert agent._generate_product_image_impl("p", "https://cdn.example/in.png") == "No result URLs."
+
+
+def test_thumbnails_are_emitted_as_generations_finish(fast_agent) -> None:
+    fast_agent.polls_until_success = 1
+    events = []
+    agent._num_images_ctx.set(2)
+    agent._event_sink_ctx.set(lambda event, data: events.append((event, data)))
+    try:
+        out = agent._generate_product_image_impl("p", "https://cdn.example/in.png")
+    finally:
+        agent._event_sink_ctx.set(None)
+
+    assert [e for e, _ in events] == ["thumbnail", "thumbnail"]
+    assert [d["url"] for _, d in events] == out.splitlines()
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import httpx
+
+import agent
+import main
+
+TURN_SECONDS = 0.5
+
+
+def fake_chat_turn(**kwargs) -> dict:
+    time.sleep(TURN_SECONDS)  # stands in for vision + ReAct loop + KIE polling
+    return {"content": f"done {kwargs['thread_id']}", "thumbnails": []}
+
+
+async def _post_chats(n: int) -> tuple[list[httpx.Response], float, float]:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        start = time.perf_counter()
+        chats = [
+            asyncio.create_task(client.post("/chat", json={"message": "hi", "thread_id": f"t{i}"}))
+            for i in range(n)
+        ]
+        await asyncio.sleep(0.05)
+        health_start = time.perf_counter()
+        health = await client.get("/health")
+        health_latency = time.perf_counter() - health_start
+        assert health.status_code == 200
+        responses = await asyncio.gather(*chats)
+        return responses, time.perf_counter() - start, health_latency
+
+
+def test_concurrent_chats_overlap(monkeypatch) -> None:
+    monkeypatch.setattr(agent, "chat_turn", fake_chat_turn)
+    n = 4
+    responses, elapsed, health_latency = asyncio.run(_post_chats(n))
+
+    assert [r.status_code for r in responses] == [200] * n
+    assert {r.json()["content"] for r in responses} == {f"done t{i}" for i in range(n)}
+    # Serialized on the event loop this would take n * TURN_SECONDS.
+    assert elapsed < TURN_SECONDS * 2
+    assert health_latency < TURN_SECONDS / 2
+
+
+def fake_streaming_turn(on_event=None, **kwargs) -> dict:
+    for word in ("Here ", "you ", "go"):
+        on_event("token", {"text": word})
+    urls = []
+    for i in range(2):
+        time.sleep(0.05)  # generations finishing one after another
+        urls.append(f"https://cdn.example/{i}.png")
+        on_event("thumbnail", {"url": urls[-1]})
+    return {"content": "Here you go", "thumbnails": urls}
+
+
+def test_chat_stream_emits_tokens_and_thumbnails_in_order(monkeypatch) -> None:
+    monkeypatch.setattr(agent, "chat_turn", fake_streaming_turn)
+
+    async def stream() -> str:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.post("/chat/stream", json={"message": "make it pop"})).text
+
+    blocks = [b for b in asyncio.run(stream()).strip().split("\n\n")]
+    events = [b.splitlines()[0].removeprefix("event: ") for b in blocks]
+
+    assert events == ["token", "token", "token", "thumbnail", "thumbnail", "done"]
+    assert '"url": "https://cdn.example/0.png"' in blocks[3]
+    assert '"thumbnails": ["https://cdn.example/0.png", "https://cdn.example/1.png"]' in blocks[5]
+
+
+def test_chat_stream_reports_errors(monkeypatch) -> None:
+    def broken_turn(**kwargs):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(agent, "chat_turn", broken_turn)
+
+    async def stream() -> str:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.post("/chat/stream", json={"message": "hi"})).text
+
+    assert asyncio.run(stream()).startswith('event: error\ndata: {"detail": "model unavailable"}')
@@ -0,0 +1,63 @@
+import contextvars
+import threading
+import time
+
+from gen_scheduler import GenerationScheduler
+
+user_ctx: contextvars.ContextVar[str | None] = contextvars.ContextVar("user", default=None)
+
+
+def test_concurrency_is_capped() -> None:
+    scheduler = GenerationScheduler(max_concurrency=3)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def job() -> None:
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    futures = [scheduler.submit(f"u{i % 4}", job) for i in range(12)]
+    for f in futures:
+        f.result(timeout=5)
+
+    assert peak[0] == 3
+    stats = scheduler.stats()
+    assert stats["completed"] == 12
+    assert stats["queue_depth"] == 0
+    assert stats["wait_p95_s"] > 0
+
+
+def test_users_are_served_round_robin() -> None:
+    scheduler = GenerationScheduler(max_concurrency=1)
+    release = threading.Event()
+    order = []
+
+    scheduler.submit("blocker", release.wait)
+    while scheduler.stats()["running"] == 0:
+        time.sleep(0.001)
+    heavy = [scheduler.submit("heavy", order.append, f"heavy{i}") for i in range(4)]
+    light = [scheduler.submit("light", order.append, f"light{i}") for i in range(2)]
+    assert scheduler.queue_depth() == 6
+    assert scheduler.queue_depth("heavy") == 4
+    release.set()
+    for f in heavy + light:
+        f.result(timeout=5)
+
+    assert order == ["heavy0", "light0", "heavy1", "light1", "heavy2", "heavy3"]
+
+
+def test_jobs_run_in_submitters_context_and_propagate_errors() -> None:
+    scheduler = GenerationScheduler(max_concurrency=2)
+    user_ctx.set("alice")
+
+    def fail() -> None:
+        raise RuntimeError("boom")
+
+    assert scheduler.submit("alice", user_ctx.get).result(timeout=5) == "alice"
+    error = scheduler.submit("alice", fail).exception(timeout=5)
+    assert isinstance(error, RuntimeError)
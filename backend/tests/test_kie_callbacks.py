@@ -0,0 +1,96 @@
+import asyncio
+import json
+import threading
+
+import httpx
+
+import kie_client
+import main
+from status_cache import StatusCache
+from task_events import TaskEvents
+
+
+def parse_sse(text: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def fresh_registry(monkeypatch) -> None:
+    monkeypatch.setattr(kie_client, "status_cache", StatusCache(ttl=0))
+    monkeypatch.setattr(kie_client, "task_events", TaskEvents())
+
+
+def test_generate_registers_callback_url(kie_stub, monkeypatch) -> None:
+    monkeypatch.setattr(kie_client, "KIE_CALLBACK_URL", "https://api.example.com/kie/callback")
+    monkeypatch.setattr(kie_client, "KIE_CALLBACK_TOKEN", "s3cret")
+
+    async def generate() -> dict:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.post("/generate", json={"model": "nano-banana-pro", "prompt": "p"})).json()
+
+    task_id = asyncio.run(generate())["data"]["taskId"]
+    assert kie_stub.tasks[task_id]["callBackUrl"] == "https://api.example.com/kie/callback?token=s3cret"
+
+
+def test_callback_completes_sse_stream_without_polling(kie_stub, monkeypatch) -> None:
+    fresh_registry(monkeypatch)
+    monkeypatch.setattr(kie_client, "KIE_CALLBACK_URL", "https://api.example.com/kie/callback")
+    kie_stub.tasks["t1"] = {"taskId": "t1", "model": "m", "state": "generating", "polls": 0}
+
+    async def stream_then_callback() -> tuple[str, float]:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            stream = asyncio.create_task(client.get("/status/stream", params={"task_id": "t1"}))
+            await asyncio.sleep(0.1)
+            kie_stub.finish("t1")
+            callback = {"code": 200, "msg": "ok", "data": {"taskId": "t1", "state": "success", "resultJson": "{}"}}
+            assert (await client.post("/kie/callback", json=callback)).status_code == 200
+            response = await stream
+            return response.text, loop.time() - start
+
+    text, elapsed = asyncio.run(stream_then_callback())
+    events = parse_sse(text)
+
+    assert [e[1]["data"]["state"] for e in events] == ["generating", "success"]
+    assert kie_stub.record_calls == 1  # Initial status only; completion came from the callback
+    assert elapsed < main.STATUS_STREAM_CALLBACK_POLL_INTERVAL
+
+
+def test_callback_wakes_blocking_waiter(monkeypatch) -> None:
+    fresh_registry(monkeypatch)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(kie_client.wait_for_completion_sync("t2", timeout=5)))
+    waiter.start()
+    while not kie_client.task_events.waiting():
+        pass
+
+    record = {"code": 200, "data": {"taskId": "t2", "state": "fail", "failMsg": "nsfw"}}
+    response = asyncio.run(_post_callback(record))
+    waiter.join(timeout=5)
+
+    assert response == 200
+    assert results == [record]
+    assert kie_client.status_cache.peek("t2") == record
+
+
+async def _post_callback(record: dict, **params) -> int:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return (await client.post("/kie/callback", json=record, params=params)).status_code
+
+
+def test_callback_token_is_checked(monkeypatch) -> None:
+    fresh_registry(monkeypatch)
+    monkeypatch.setattr(main, "KIE_CALLBACK_TOKEN", "s3cret")
+    record = {"code": 200, "data": {"taskId": "t3", "state": "success"}}
+
+    assert asyncio.run(_post_callback(record, token="wrong")) == 403
+    assert kie_client.status_cache.peek("t3") is None
+    assert asyncio.run(_post_callback(record, token="s3cret")) == 200
@@ -0,0 +1,46 @@
+import asyncio
+
+import httpx
+
+import kie_client
+import main
+from status_cache import StatusCache
+
+
+async def _generate_and_poll() -> tuple[dict, dict, set[int]]:
+    transport = httpx.ASGITransport(app=main.app)
+    clients = set()
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        created = await client.post("/generate", json={"model": "nano-banana-pro", "prompt": "studio"})
+        clients.add(id(kie_client.get_async_client()))
+        task_id = created.json()["data"]["taskId"]
+        status = {}
+        for _ in range(3):
+            status = (await client.get("/status", params={"task_id": task_id})).json()
+            clients.add(id(kie_client.get_async_client()))
+        return created.json(), status, clients
+
+
+def test_generate_and_status_share_one_pooled_client(kie_stub, monkeypatch) -> None:
+    stub = kie_stub
+    monkeypatch.setattr(kie_client, "status_cache", StatusCache(ttl=0))
+    stub.polls_until_success = 2
+
+    created, status, clients = asyncio.run(_generate_and_poll())
+
+    assert created["data"]["taskId"] in stub.tasks
+    assert status["data"]["state"] == "success"
+    assert stub.create_calls == 1
+    assert stub.record_calls == 3
+    assert len(clients) == 1
+
+
+def test_kie_errors_pass_through(kie_stub) -> None:
+    async def fetch_unknown_task() -> httpx.Response:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/status", params={"task_id": "missing"})
+
+    response = asyncio.run(fetch_unknown_task())
+    assert response.status_code == 404
+    assert "task not found" in response.json()["detail"]
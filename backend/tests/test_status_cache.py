@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+
+import kie_client
+import main
+from status_cache import StatusCache
+
+
+async def _poll(task_id: str, concurrent: int, rounds: int = 1) -> list[dict]:
+    transport = httpx.ASGITransport(app=main.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for _ in range(rounds):
+            responses = await asyncio.gather(
+                *(client.get("/status", params={"task_id": task_id}) for _ in range(concurrent))
+            )
+            results.extend(r.json() for r in responses)
+    return results
+
+
+def test_concurrent_polls_share_one_upstream_call(kie_stub, monkeypatch) -> None:
+    stub = kie_stub
+    cache = StatusCache(ttl=0)
+    monkeypatch.setattr(kie_client, "status_cache", cache)
+    stub.delay = 0.2
+    stub.tasks["t1"] = {"taskId": "t1", "model": "m", "state": "generating", "polls": 0}
+
+    results = asyncio.run(_poll("t1", concurrent=20))
+
+    assert {r["data"]["state"] for r in results} == {"generating"}
+    assert stub.record_calls == 1
+    assert cache.stats()["coalesced"] == 19
+
+
+def test_fresh_results_are_reused_within_ttl(kie_stub, monkeypatch) -> None:
+    stub = kie_stub
+    monkeypatch.setattr(kie_client, "status_cache", StatusCache(ttl=60))
+    stub.tasks["t2"] = {"taskId": "t2", "model": "m", "state": "generating", "polls": 0}
+
+    asyncio.run(_poll("t2", concurrent=1, rounds=5))
+
+    assert stub.record_calls == 1
+
+
+def test_terminal_states_are_never_refetched(kie_stub, monkeypatch) -> None:
+    stub = kie_stub
+    monkeypatch.setattr(kie_client, "status_cache", StatusCache(ttl=0))
+    stub.tasks["t3"] = {"taskId": "t3", "model": "m", "state": "generating", "polls": 0}
+    stub.finish("t3")
+
+    results = asyncio.run(_poll("t3", concurrent=3, rounds=4))
+
+    assert {r["data"]["state"] for r in results} == {"success"}
+    assert stub.record_calls == 1
+
+
+def test_upstream_errors_are_not_cached(kie_stub, monkeypatch) -> None:
+    stub = kie_stub
+    monkeypatch.setattr(kie_client, "status_cache", StatusCache(ttl=60))
+
+    async def poll_missing() -> list[int]:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [(await client.get("/status", params={"task_id": "gone"})).status_code for _ in range(2)]
+
+    assert asyncio.run(poll_missing()) == [404, 404]
+    assert stub.record_calls == 2
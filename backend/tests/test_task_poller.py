@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+import task_poller
+from task_events import TaskEvents
+from task_poller import TaskPoller
+
+
+@pytest.fixture(autouse=True)
+def fast_intervals(monkeypatch):
+    monkeypatch.setattr(task_poller, "POLLER_MIN_INTERVAL", 0.02)
+    monkeypatch.setattr(task_poller, "POLLER_MAX_INTERVAL", 0.5)
+    monkeypatch.setattr(task_poller, "DEFAULT_COMPLETION_TIMES", (0.3, 0.4, 0.5))
+
+
+class FakeKie:
+    """Tasks finish `duration` seconds after creation; records every poll time."""
+
+    def __init__(self, duration: float) -> None:
+        self.duration = duration
+        self.created: dict[str, float] = {}
+        self.polls: dict[str, list[float]] = {}
+        self.lock = threading.Lock()
+
+    def create(self, task_id: str) -> None:
+        self.created[task_id] = time.monotonic()
+
+    def fetch(self, task_id: str) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            self.polls.setdefault(task_id, []).append(now - self.created[task_id])
+        state = "success" if now - self.created[task_id] >= self.duration else "generating"
+        return {"code": 200, "data": {"taskId": task_id, "state": state}}
+
+
+def test_many_tasks_share_one_poller_thread() -> None:
+    kie = FakeKie(duration=0.35)
+    poller = TaskPoller(kie.fetch)
+    threads_before = threading.active_count()
+
+    futures = []
+    for i in range(50):
+        kie.create(f"t{i}")
+        futures.append(poller.track(f"t{i}"))
+    records = [f.result(timeout=5) for f in futures]
+
+    assert {r["data"]["state"] for r in records} == {"success"}
+    assert threading.active_count() - threads_before <= 1 + task_poller.POLLER_FETCH_WORKERS
+    assert poller.stats()["completed"] == 50
+
+
+def test_no_polls_before_the_fast_tail() -> None:
+    kie = FakeKie(duration=0.45)
+    poller = TaskPoller(kie.fetch)
+    kie.create("t")
+
+    poller.track("t").result(timeout=5)
+
+    # Prior says little finishes before 0.3s: one probe at half of that, then nothing until 0.3s
+    assert kie.polls["t"][0] >= 0.14
+    assert kie.polls["t"][1] >= 0.28
+    assert len(kie.polls["t"]) <= 2 + (0.45 - 0.3) / 0.02 + 1
+
+
+def test_learns_completion_times() -> None:
+    kie = FakeKie(duration=0.1)
+    poller = TaskPoller(kie.fetch)
+    for i in range(10):
+        kie.create(f"t{i}")
+        poller.track(f"t{i}").result(timeout=5)
+
+    p10, _, p90 = poller.quantiles()
+    assert p90 < 0.3  # Prior (0.3-0.5s) replaced by observed ~0.1s completions
+    kie.create("late")
+    start = time.monotonic()
+    poller.track("late").result(timeout=5)
+    assert time.monotonic() - start < 0.3
+
+
+def test_published_event_resolves_without_polling() -> None:
+    events = TaskEvents()
+    kie = FakeKie(duration=60)
+    poller = TaskPoller(kie.fetch, events=events)
+    kie.create("t")
+
+    future = poller.track("t")
+    record = {"code": 200, "data": {"taskId": "t", "state": "success"}}
+    events.publish("t", record)
+
+    assert future.result(timeout=1) == record
+    assert "t" not in kie.polls
+    assert events.waiting() == 0
+
+
+def test_times_out() -> None:
+    kie = FakeKie(duration=60)
+    poller = TaskPoller(kie.fetch)
+    kie.create("t")
+
+    with pytest.raises(TimeoutError):
+        poller.track("t", timeout=0.3).result(timeout=5)
+    assert poller.stats()["timeouts"] == 1
@@ -0,0 +1,54 @@
+import hashlib
+
+from fastapi.testclient import TestClient
+
+import main
+
+client = TestClient(main.app)
+
+
+def test_upload_streams_to_disk_and_hashes() -> None:
+    content = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 9000  # ~2.3 MB, several chunks
+    response = client.post("/upload", files={"file": ("shot.png", content, "image/png")})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["size"] == len(content)
+    assert body["sha256"] == hashlib.sha256(content).hexdigest()
+    assert (main.UPLOAD_DIR / body["filename"]).read_bytes() == content
+    assert not list(main.UPLOAD_DIR.glob(".*.part"))
+
+
+def test_upload_rejects_oversized_file(monkeypatch) -> None:
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 1024)
+    before = set(main.UPLOAD_DIR.iterdir())
+
+    small_body = client.post("/upload", files={"file": ("big.png", b"x" * 4096, "image/png")})
+    huge_body = client.post("/upload", files={"file": ("huge.png", b"x" * 200_000, "image/png")})
+
+    assert small_body.status_code == 413
+    assert huge_body.status_code == 413
+    assert set(main.UPLOAD_DIR.iterdir()) == before
+
+
+def test_repeat_upload_is_deduplicated(monkeypatch) -> None:
+    puts = []
+
+    def fake_upload_to_s3(file_path, content_type):
+        puts.append(file_path.name)
+        return f"https://bucket.s3.us-east-1.amazonaws.com/uploads/{file_path.name}"
+
+    monkeypatch.setattr(main, "USE_S3", True)
+    monkeypatch.setattr(main, "upload_to_s3", fake_upload_to_s3)
+    content = b"same product shot " * 1000
+
+    first = client.post("/upload", files={"file": ("a.JPG", content, "image/jpeg")}).json()
+    second = client.post("/upload", files={"file": ("b.jpg", content, "image/jpeg")}).json()
+
+    sha256 = hashlib.sha256(content).hexdigest()
+    assert first["filename"] == f"{sha256}.jpg"
+    assert first["deduplicated"] is False
+    assert second["deduplicated"] is True
+    assert second["url"] == first["url"]
+    assert puts == [first["filename"]]
+    assert not list(main.UPLOAD_DIR.glob(".*.part"))
@@ -0,0 +1,74 @@
+"""
+Content-addressed upload index: sha256 of the file -> public URL and metadata.
+Lets /upload return the existing URL for repeat uploads without a disk write or S3 PUT.
+Stored in SQLite outside UPLOAD_DIR so it is never served under /files.
+"""
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class UploadIndex:
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS uploads (
+                sha256 TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                content_type TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_seen_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self._conn.commit()
+
+    def lookup(self, sha256: str) -> dict | None:
+        """Return the stored entry for this hash (and bump its hit count), or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, filename, content_type, size, created_at, hits FROM uploads WHERE sha256 = ?",
+                (sha256,),
+            ).fetchone()
+            if not row:
+                return None
+            self._conn.execute(
+                "UPDATE uploads SET hits = hits + 1, last_seen_at = ? WHERE sha256 = ?",
+                (time.time(), sha256),
+            )
+            self._conn.commit()
+        url, filename, content_type, size, created_at, hits = row
+        return {
+            "sha256": sha256,
+            "url": url,
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+            "created_at": created_at,
+            "hits": hits + 1,
+        }
+
+    def record(self, sha256: str, url: str, filename: str, content_type: str | None, size: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO uploads (sha256, url, filename, content_type, size, created_at, last_seen_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(sha256) DO UPDATE SET
+                    url = excluded.url, filename = excluded.filename,
+                    content_type = excluded.content_type, last_seen_at = excluded.last_seen_at""",
+                (sha256, url, filename, content_type, size, now, now),
+            )
+            self._conn.commit()
+
+    def forget(self, sha256: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM uploads WHERE sha256 = ?", (sha256,))
+            self._conn.commit()
@@ -89,10 +89,48 @@ def create_generate_task(
     return task_id
 
 
+def _result_urls(data: dict) -> list[str]:
+    result_json = data.get("data", {}).get("resultJson") or "{}"
+    try:
+        return json.loads(result_json).get("resultUrls", [])
+    except json.JSONDecodeError:
+        return []
+
+
+def stream_status(task_id: str, backend_url: Optional[str] = None, max_wait_sec: int = 120) -> list[str]:
+    """Wait on /status/stream (server-sent events) until success or fail. Returns list of result URLs."""
+    base = backend_url or get_backend_url()
+    with requests.get(
+        f"{base}/status/stream",
+        params={"task_id": task_id},
+        stream=True,
+        timeout=(30, max_wait_sec),
+    ) as response:
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event in ("error", "timeout"):
+                    raise RuntimeError(f"Status stream {event}: {data}")
+                state = data.get("data", {}).get("state")
+                if state == "success":
+                    return _result_urls(data)
+                if state == "fail":
+                    raise RuntimeError(f"Generation failed: {data}")
+    raise TimeoutError(f"Status stream ended before task {task_id} finished")
+
+
 def poll_status(task_id: str, backend_url: Optional[str] = None, max_wait_sec: int = 120) -> list[str]:
-    """Poll /status until success or fail. Returns list of result URLs."""
+    """Wait for success or fail via /status/stream, falling back to polling /status. Returns list of result URLs."""
     base = backend_url or get_backend_url()
     start = time.time()
+    try:
+        return stream_status(task_id, backend_url=base, max_wait_sec=max_wait_sec)
+    except (requests.RequestException, TimeoutError):
+        pass  # Older backend without /status/stream, or the stream dropped
     while time.time() - start < max_wait_sec:
         response = requests.get(
             f"{base}/status",
@@ -103,12 +141,7 @@ def poll_status(task_id: str, backend_url: Optional[str] = None, max_wait_sec: i
         data = response.json()
         state = data.get("data", {}).get("state")
         if state == "success":
-            result_json = data.get("data", {}).get("resultJson") or "{}"
-            try:
-                parsed = json.loads(result_json)
-                return parsed.get("resultUrls", [])
-            except json.JSONDecodeError:
-                return []
+            return _result_urls(data)
         if state == "fail":
             raise RuntimeError(f"Generation failed: {data}")
         time.sleep(3)